@@ -1,5 +1,9 @@
+import asyncio
+import gzip
 import os
 import pprint
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import traceback
 from PyQt6.QtWidgets import (
@@ -7,29 +11,62 @@ from PyQt6.QtWidgets import (
     QLabel, QMessageBox, QCheckBox
 )
 from openvpnclient import OpenVPNClient
-from websocket import create_connection
-import threading
-import json
+from qasync import QEventLoop, asyncSlot
+from websockets.asyncio.client import connect
+from websockets.protocol import State
+import orjson
 import sys
-import time
+
+
+# Просим сервер слать фреймы в gzip; старый сервер просто не выберет
+# этот subprotocol, и фреймы придут несжатыми
+GZIP_SUBPROTOCOL = "json.gzip"
+
+# Общий пул для блокирующих вызовов: всё это I/O, много потоков не нужно,
+# и на каждый клик поток не создаётся
+_EXEC = ThreadPoolExecutor(max_workers=4)
+
+# Сколько ждать готовности туннеля от openvpn
+VPN_CONNECT_TIMEOUT = 30
 
 
 class WebSocketClient:
-    def __init__(self, url):
+    def __init__(self, url, timeout=10):
         self.url = url
+        self.timeout = timeout
         self.ws = None
-
-    def connect(self):
-        self.ws = create_connection(self.url)
+        self.greeting = None
+
+    async def connect(self):
+        # permessage-deflate поверх gzip ничего не даёт, отключаем
+        self.ws = await connect(
+            self.url, subprotocols=[GZIP_SUBPROTOCOL], compression=None,
+            open_timeout=self.timeout,
+        )
         return self.ws
 
-    def receive_json(self):
+    async def receive_json(self):
         if self.ws:
-            return json.loads(self.ws.recv())
-
-    def close(self):
+            # Не висим вечно, если сервер за медленным VPN так и не ответил.
+            # decode=False: всегда bytes, orjson читает их без UTF-8 декодирования
+            raw = await asyncio.wait_for(self.ws.recv(decode=False), self.timeout)
+            if self.ws.subprotocol == GZIP_SUBPROTOCOL:
+                raw = gzip.decompress(raw)
+            return orjson.loads(raw)
+
+    async def ensure_connected(self):
+        # Соединение живёт между кликами; приветствие сервер шлёт только
+        # при подключении, поэтому запоминаем его
+        if self.ws is None or self.ws.state is not State.OPEN:
+            await self.connect()
+            self.greeting = await self.receive_json()
+        return self.greeting
+
+    async def close(self):
         if self.ws:
-            self.ws.close()
+            await self.ws.close()
+            self.ws = None
+            self.greeting = None
 
 
 class MainWindow(QWidget):
@@ -50,52 +87,114 @@ class MainWindow(QWidget):
 
         self.button.clicked.connect(self.connect_to_server)  # noqa
 
-    def connect_to_server(self):
+        self.vpn = None
+        self._ws_client = None
+
+    @asyncSlot()
+    async def connect_to_server(self):
+        # Не даём запустить второе подключение, пока живо первое,
+        # иначе плодятся процессы openvpn
+        if self.vpn is not None:
+            return
+        self.button.setEnabled(False)
+
         LOCALAPPDATA = Path(os.getcwd())
         file_path = Path(LOCALAPPDATA / "client1.ovpn")
         print(file_path)
-        def task():
-            vpn = None
+        # OpenVPNClient блокирующий, поэтому гоняем его в executor,
+        # а WebSocket и обновление виджетов остаются в Qt-потоке
+        loop = asyncio.get_running_loop()
+        if self._ws_client is None:
+            self._ws_client = WebSocketClient("ws://127.0.0.1:8000/ws")
+        try:
+            if self.checkbox.isChecked():
+                self.label.setText("Подключение к VPN...")
+                # Соединение, открытое мимо туннеля, после подъёма VPN не годится
+                await self._ws_client.close()
+                vpn = OpenVPNClient(str(file_path))
+                # Та же проверка, что и в connect(): живой или оставшийся
+                # PID-файл значит, что openvpn уже запущен, второй не плодим
+                if vpn._get_pid() != -1:
+                    raise ConnectionRefusedError("OpenVPN уже запущен (найден PID-файл)")
+                # route-up присылает нам SIGUSR1. OpenVPNClient.connect() ставит
+                # обработчик через signal.signal, что работает только в главном
+                # потоке, поэтому ловим сигнал через loop, а в executor
+                # запускаем только сам процесс
+                route_up = asyncio.Event()
+                loop.add_signal_handler(signal.SIGUSR1, route_up.set)
+                try:
+                    await loop.run_in_executor(_EXEC, vpn._start_process)
+                    self.vpn = vpn
+                    # Если openvpn умрёт до route-up, не ждём весь таймаут
+                    up = asyncio.ensure_future(route_up.wait())
+                    exited = loop.run_in_executor(_EXEC, vpn.proc.wait)
+                    done, _ = await asyncio.wait(
+                        {up, exited}, timeout=VPN_CONNECT_TIMEOUT,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    up.cancel()
+                    if up not in done:
+                        if exited in done:
+                            # disconnect() уже нечего убивать, убираем только файлы
+                            self.vpn = None
+                            vpn._cleanup()
+                            raise ConnectionError("OpenVPN завершился, не установив соединение.")
+                        raise TimeoutError(f"VPN не поднялся за {VPN_CONNECT_TIMEOUT} с")
+                finally:
+                    loop.remove_signal_handler(signal.SIGUSR1)
+                    # remove_signal_handler возвращает SIG_DFL, а по умолчанию
+                    # SIGUSR1 убивает процесс: запоздалый или повторный route-up
+                    # уронил бы GUI. Игнорируем его дальше, как и connect()
+                    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+                self.label.setText("VPN подключен. Подключение к WebSocket...")
+            else:
+                self.label.setText("Подключение к WebSocket...")
+
+            data = await self._ws_client.ensure_connected()
+
+            self.label.setText(
+                f"✅ Успешно подключено\n"
+                f"Client IP: {data['client_ip']}\n"
+                f"Host IP: {data['host_ip']}\n"
+                f"Host Name: {data['host_name']}"
+            )
+
+        except Exception as e:
+            traceback.print_exc()
+            # QMessageBox.critical(self, "Ошибка", str(e))
+
+        finally:
             try:
-                if self.checkbox.isChecked():
-                    self.label.setText("Подключение к VPN...")
-                    vpn = OpenVPNClient(str(file_path))
-                    vpn.connect()
-
-                    time.sleep(3)  # немного подождать, чтобы VPN поднялся
-                    self.label.setText("VPN подключен. Подключение к WebSocket...")
-                else:
-                    self.label.setText("Подключение к WebSocket...")
-
-                ws_client = WebSocketClient("ws://127.0.0.1:8000/ws")
-                ws = ws_client.connect()
-                data = ws_client.receive_json()
-
-                self.label.setText(
-                    f"✅ Успешно подключено\n"
-                    f"Client IP: {data['client_ip']}\n"
-                    f"Host IP: {data['host_ip']}\n"
-                    f"Host Name: {data['host_name']}"
-                )
-
-                ws_client.close()
-
+                if self.vpn:
+                    # Соединение шло через туннель и закроется вместе с ним
+                    await self._ws_client.close()
+                    await loop.run_in_executor(_EXEC, self.vpn.disconnect)
             except Exception as e:
                 traceback.print_exc()
-                # QMessageBox.critical(self, "Ошибка", str(e))
-
             finally:
-                if vpn:
-                    vpn.disconnect()
+                self.vpn = None
+                self.button.setEnabled(True)
 
-        threading.Thread(target=task).start()
+    def closeEvent(self, event):
+        if self._ws_client:
+            asyncio.ensure_future(self._ws_client.close())
+        super().closeEvent(event)
 
 
 def main():
     app = QApplication(sys.argv)
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    app_close_event = asyncio.Event()
+    app.aboutToQuit.connect(app_close_event.set)  # noqa
+
     win = MainWindow()
     win.show()
-    sys.exit(app.exec())
+
+    with loop:
+        loop.run_until_complete(app_close_event.wait())
 
 
 if __name__ == "__main__":
@@ -1,77 +1,168 @@
+import asyncio
+import functools
+import gzip
 import os
 import subprocess
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton,
     QLabel, QCheckBox
 )
-from websocket import create_connection
-import threading
-import json
+from qasync import QEventLoop, asyncSlot
+from websockets.asyncio.client import connect
+from websockets.protocol import State
+import orjson
 import sys
-import time
 import shutil
 import platform
 
 
+# Просим сервер слать фреймы в gzip; старый сервер просто не выберет
+# этот subprotocol, и фреймы придут несжатыми
+GZIP_SUBPROTOCOL = "json.gzip"
+
+# Общий пул для блокирующих вызовов: всё это I/O, много потоков не нужно,
+# и на каждый клик поток не создаётся
+_EXEC = ThreadPoolExecutor(max_workers=4)
+
+# Сколько ждать готовности туннеля от openvpn
+VPN_CONNECT_TIMEOUT = 30
+
+# Стандартный установщик OpenVPN для Windows не всегда прописывает bin в PATH.
+# Дописываем один раз при импорте и только если его там ещё нет
+_OVPN_DIR = r"C:\Program Files\OpenVPN\bin"
+
+
+def _ensure_openvpn_on_path():
+    # PATH на Windows регистронезависим, элементы могут заканчиваться на "\",
+    # поэтому сравниваем элементы целиком, а не ищем подстроку
+    path = os.environ.get("PATH", "")
+    entries = {os.path.normcase(p.rstrip("\\")) for p in path.split(os.pathsep)}
+    if os.path.normcase(_OVPN_DIR) not in entries:
+        os.environ["PATH"] = os.pathsep.join(filter(None, [path, _OVPN_DIR]))
+
+
+if platform.system() == "Windows":
+    _ensure_openvpn_on_path()
+
+
+# Поиск по PATH небыстрый (на Windows перебираются все расширения из PATHEXT),
+# поэтому ищем openvpn один раз; после правки PATH - _openvpn_bin.cache_clear()
+@functools.lru_cache(maxsize=1)
+def _openvpn_bin():
+    return shutil.which("openvpn")
+
+
 class WebSocketClient:
-    def __init__(self, url):
+    def __init__(self, url, timeout=10):
         self.url = url
+        self.timeout = timeout
         self.ws = None
+        self.greeting = None
 
-    def connect(self):
-        self.ws = create_connection(self.url)
+    async def connect(self):
+        # permessage-deflate поверх gzip ничего не даёт, отключаем
+        self.ws = await connect(
+            self.url, subprotocols=[GZIP_SUBPROTOCOL], compression=None,
+            open_timeout=self.timeout,
+        )
         return self.ws
 
-    def receive_json(self):
+    async def receive_json(self):
         if self.ws:
-            return json.loads(self.ws.recv())
+            # Не висим вечно, если сервер за медленным VPN так и не ответил.
+            # decode=False: всегда bytes, orjson читает их без UTF-8 декодирования
+            raw = await asyncio.wait_for(self.ws.recv(decode=False), self.timeout)
+            if self.ws.subprotocol == GZIP_SUBPROTOCOL:
+                raw = gzip.decompress(raw)
+            return orjson.loads(raw)
+
+    async def ensure_connected(self):
+        # Соединение живёт между кликами; приветствие сервер шлёт только
+        # при подключении, поэтому запоминаем его
+        if self.ws is None or self.ws.state is not State.OPEN:
+            await self.connect()
+            self.greeting = await self.receive_json()
+        return self.greeting
 
-    def close(self):
+    async def close(self):
         if self.ws:
-            self.ws.close()
+            await self.ws.close()
+            self.ws = None
+            self.greeting = None
 
 
 class OpenVPNClient:
     def __init__(self, config_path):
         self.config_path = config_path
         self.process = None
+        self._log_task = None
+        self.connected = False
+        self._ready = asyncio.Event()
 
-    def connect(self):
-        openvpn_bin = shutil.which("openvpn")
+    async def connect(self):
+        openvpn_bin = _openvpn_bin()
         if not openvpn_bin:
+            _openvpn_bin.cache_clear()  # промах не кэшируем: OpenVPN могут доустановить
             raise FileNotFoundError("OpenVPN не найден в системном PATH.")
 
         print(f"Запуск OpenVPN с конфигом: {self.config_path}")
 
         if platform.system() == "Windows":
-            self.process = subprocess.Popen(
-                [openvpn_bin, "--config", str(self.config_path)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.DEVNULL,
+            self.process = await asyncio.create_subprocess_exec(
+                openvpn_bin, "--config", str(self.config_path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.DEVNULL,
                 creationflags=subprocess.CREATE_NEW_CONSOLE
             )
         else:
-            self.process = subprocess.Popen(
-                [openvpn_bin, "--config", str(self.config_path)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.DEVNULL
+            self.process = await asyncio.create_subprocess_exec(
+                openvpn_bin, "--config", str(self.config_path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.DEVNULL
             )
 
-        # Печатаем логи в фоне
-        threading.Thread(target=self._print_logs, daemon=True).start()
+        # Печатаем логи в фоне, в том же event loop
+        self._log_task = asyncio.create_task(self._pump_logs())
 
-    def _print_logs(self):
-        for line in self.process.stdout:
-            print("VPN LOG:", line.decode(errors="ignore").strip())
+    async def _pump_logs(self):
+        # Лог только печатаем, поэтому не декодируем: пишем байты как есть
+        try:
+            # Под pythonw stdout нет: тогда лог просто вычитываем, иначе
+            # openvpn встанет на заполненном пайпе
+            out = getattr(sys.stdout, "buffer", None)
+            if out is not None:
+                # Пишем мимо текстового слоя, так что сначала выталкиваем
+                # уже напечатанное через print(), чтобы не перепутать порядок
+                sys.stdout.flush()
+            async for line in self.process.stdout:
+                if out is not None:
+                    out.write(b"VPN LOG: " + line.rstrip(b"\r\n") + b"\n")
+                    out.flush()
+                # OpenVPN пишет это после route-up, туннель готов
+                if not self.connected and b"Initialization Sequence Completed" in line:
+                    self.connected = True
+                    self._ready.set()
+        finally:
+            # Процесс завершился: будим wait_connected, а не ждём таймаут
+            self._ready.set()
+
+    async def wait_connected(self, timeout):
+        await asyncio.wait_for(self._ready.wait(), timeout)
+        if not self.connected:
+            raise ConnectionError("OpenVPN завершился, не установив соединение.")
 
-    def disconnect(self):
+    async def disconnect(self):
         if self.process:
-            self.process.terminate()
-            self.process.wait()
+            # Уже завершившемуся процессу asyncio-terminate() кидает
+            # ProcessLookupError, в отличие от Popen
+            if self.process.returncode is None:
+                self.process.terminate()
+            await self.process.wait()
             self.process = None
 
 
@@ -97,6 +188,7 @@ class MainWindow(QWidget):
         self.button.clicked.connect(self.connect_to_server)
 
         self.vpn = None
+        self._ws_client = None
 
     def get_public_ip(self):
         import requests
@@ -104,64 +196,92 @@ class MainWindow(QWidget):
             return requests.get("https://api.ipify.org").text
         except:
             return "Ошибка запроса IP"
-    def connect_to_server(self):
+
+    @asyncSlot()
+    async def connect_to_server(self):
+        # Не даём запустить второе подключение, пока живо первое,
+        # иначе плодятся процессы openvpn
+        if self.vpn is not None:
+            return
+        self.button.setEnabled(False)
+
         LOCALAPPDATA = Path(os.getcwd())
         print(LOCALAPPDATA)
         file_path = LOCALAPPDATA / "client2.ovpn"
         print(f"Используем конфиг: {file_path}")
 
-        def task():
-            try:
-                ip_before = self.get_public_ip()
-                self.ip_before.setText(f"IP до VPN: {ip_before}")
-                if self.checkbox.isChecked():
-                    self.label.setText("Подключение к VPN...")
-                    self.vpn = OpenVPNClient(file_path)
-                    self.vpn.connect()
-
-                    time.sleep(5)  # Дать VPN подняться
-                    ip_after = self.get_public_ip()
-                    self.ip_after.setText(f"IP после VPN: {ip_after}")
-                    ws_client = WebSocketClient("ws://127.0.0.1:8000/ws")
-                    self.label.setText("VPN подключен. Подключение к WebSocket...")
-                else:
-                    ws_client = WebSocketClient("ws://127.0.0.1:8000/ws")
-                    self.label.setText("Подключение к WebSocket без VPN...")
-                    self.ip_after.setText(f"VPN не использовался")
-                ws_client.connect()
-                data = ws_client.receive_json()
-
-                self.label.setText(
-                    f"✅ Успешно подключено\n"
-                    f"Client IP: {data['client_ip']}\n"
-                    f"Host IP: {data['host_ip']}\n"
-                    f"Host Name: {data['host_name']}"
-                )
-                print(
-                    f"✅ Успешно подключено\n"
-                    f"Client IP: {data['client_ip']}\n"
-                    f"Host IP: {data['host_ip']}\n"
-                    f"Host Name: {data['host_name']}"
-                )
-
-                # ws_client.close()
+        # requests блокирует, поэтому уводим его в executor,
+        # а WebSocket и обновление виджетов остаются в Qt-потоке
+        loop = asyncio.get_running_loop()
+        if self._ws_client is None:
+            self._ws_client = WebSocketClient("ws://127.0.0.1:8000/ws")
+        try:
+            ip_before = await loop.run_in_executor(_EXEC, self.get_public_ip)
+            self.ip_before.setText(f"IP до VPN: {ip_before}")
+            if self.checkbox.isChecked():
+                self.label.setText("Подключение к VPN...")
+                # Соединение, открытое мимо туннеля, после подъёма VPN не годится
+                await self._ws_client.close()
+                self.vpn = OpenVPNClient(file_path)
+                await self.vpn.connect()
+
+                await self.vpn.wait_connected(VPN_CONNECT_TIMEOUT)
+                ip_after = await loop.run_in_executor(_EXEC, self.get_public_ip)
+                self.ip_after.setText(f"IP после VPN: {ip_after}")
+                self.label.setText("VPN подключен. Подключение к WebSocket...")
+            else:
+                self.label.setText("Подключение к WebSocket без VPN...")
+                self.ip_after.setText(f"VPN не использовался")
+            data = await self._ws_client.ensure_connected()
+
+            self.label.setText(
+                f"✅ Успешно подключено\n"
+                f"Client IP: {data['client_ip']}\n"
+                f"Host IP: {data['host_ip']}\n"
+                f"Host Name: {data['host_name']}"
+            )
+            print(
+                f"✅ Успешно подключено\n"
+                f"Client IP: {data['client_ip']}\n"
+                f"Host IP: {data['host_ip']}\n"
+                f"Host Name: {data['host_name']}"
+            )
+
+        except Exception as e:
+            traceback.print_exc()
+            self.label.setText(f"Ошибка: {e}")
 
+        finally:
+            try:
+                if self.vpn:
+                    # Соединение шло через туннель и закроется вместе с ним
+                    await self._ws_client.close()
+                    await self.vpn.disconnect()
             except Exception as e:
                 traceback.print_exc()
-                self.label.setText(f"Ошибка: {e}")
-
             finally:
-                if self.vpn:
-                    self.vpn.disconnect()
+                self.vpn = None
+                self.button.setEnabled(True)
 
-        threading.Thread(target=task).start()
+    def closeEvent(self, event):
+        if self._ws_client:
+            asyncio.ensure_future(self._ws_client.close())
+        super().closeEvent(event)
 
 
 def main():
     app = QApplication(sys.argv)
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    app_close_event = asyncio.Event()
+    app.aboutToQuit.connect(app_close_event.set)
+
     win = MainWindow()
     win.show()
-    sys.exit(app.exec())
+
+    with loop:
+        loop.run_until_complete(app_close_event.wait())
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 """OpenVPN client module."""
 
 
+import functools
 import logging
 import os
 import shutil
@@ -8,6 +9,7 @@ import signal
 import subprocess
 import sys
 import threading
+import time
 from enum import Enum
 from pathlib import Path
 from subprocess import PIPE, CalledProcessError, check_call
@@ -20,6 +22,7 @@ from typing_extensions import Self
 PID_FILE = Path(gettempdir()) / "openvpnclient.pid"
 STDERR_FILE = Path(gettempdir()) / "openvpnclient.stderr"
 STDOUT_FILE = Path(gettempdir()) / "openvpnclient.stdout"
+SUDO_CHECK_TTL = 300  # seconds to reuse the result of the passwordless sudo probe
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 console_handler = logging.StreamHandler()
@@ -31,6 +34,15 @@ console_handler.setFormatter(
 logger.addHandler(console_handler)
 
 
+@functools.lru_cache(maxsize=1)
+def _openvpn_bin() -> str | None:
+    """Locate the openvpn executable on the PATH, once per process.
+
+    Call ``_openvpn_bin.cache_clear()`` after changing PATH.
+    """
+    return shutil.which("openvpn")
+
+
 class Status(Enum):
     """Status codes for the OpenVPN client."""
 
@@ -46,6 +58,9 @@ class OpenVPNClient:
     status: Status = Status.IDLE
     timer: threading.Timer
     lock: threading.Lock
+    _pw_cache: bool | None = None
+    _pw_checked_at: float = 0.0
+    _child: subprocess.Popen | None = None
 
     def __init__(self, ovpn_file: str, connect_timeout: int = 5) -> None:
         """Initialize the OpenVPN client.
@@ -64,7 +79,8 @@ class OpenVPNClient:
             err_msg = f"File '{ovpn_file}' not found, or is not a file"
             raise FileNotFoundError(err_msg)
 
-        if not shutil.which("openvpn"):
+        if not _openvpn_bin():
+            _openvpn_bin.cache_clear()  # don't remember a miss, it may get installed
             err_msg = "OpenVPN must be installed and available on the PATH"
             raise RuntimeError(err_msg)
 
@@ -133,18 +149,28 @@ class OpenVPNClient:
         cmd.append(  # command for route-up should be 'one argument'
             f"{sys.executable} -c 'import os, signal; os.kill({os.getpid()}, signal.SIGUSR1)'"
         )
-        self.proc = subprocess.Popen(
-            cmd,
-            stdin=PIPE,
-            stdout=STDOUT_FILE.open("w"),
-            stderr=STDERR_FILE.open("w"),
-            text=True,
-        )
+        # raw fds: the child inherits them, so ours can be closed right away
+        # instead of leaking file objects until GC
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        out_fd = os.open(STDOUT_FILE, flags, 0o600)
+        err_fd = os.open(STDERR_FILE, flags, 0o600)
+        try:
+            self.proc = subprocess.Popen(
+                cmd,
+                stdin=PIPE,
+                stdout=out_fd,
+                stderr=err_fd,
+                text=True,
+            )
+        finally:
+            os.close(out_fd)
+            os.close(err_fd)
         if must_supply_password:
             self.proc.stdin.write(os.environ["SUDO_PASSWORD"] + "\n")
             self.proc.stdin.flush()
 
         PID_FILE.write_text(str(self.proc.pid), encoding="ascii")
+        OpenVPNClient._child = self.proc
 
     def _setup_handlers(self, *, sigint_disconnect: bool) -> None:
         # when the openvpn process has connected the remote server
@@ -175,14 +201,22 @@ class OpenVPNClient:
         self.timer.start()
 
     @staticmethod
-    def _on_process_exit(pid: int, *, timeout: int | None = None) -> None:
+    def _on_process_exit(
+        pid: int, *, proc: subprocess.Popen | None = None, timeout: int | None = None
+    ) -> None:
         """Wait for the OpenVPN process to exit and log the result.
 
         :param pid: The PID of the OpenVPN process
+        :param proc: The Popen handle when the process is our own child, waited on
+            directly instead of being polled through psutil
         :param timeout: The time to wait for the process to exit, defaults to unlimited
         :raises ConnectionRefusedError: If the OpenVPN process wrote on stderr
         """
-        psutil.Process(pid).wait(timeout=timeout)
+        if proc is not None:
+            proc.wait(timeout=timeout)
+            OpenVPNClient._child = None
+        else:
+            psutil.Process(pid).wait(timeout=timeout)
         log_msg = "Process exited"
         stderr = Path(STDERR_FILE).read_text(encoding="ascii").strip()
         stdout = Path(STDOUT_FILE).read_text(encoding="ascii").strip()
@@ -203,19 +237,30 @@ class OpenVPNClient:
     def _must_supply_password() -> bool:
         """Check if passwordless sudo is available or if password is in environment.
 
+        The result of the sudo probe is cached for SUDO_CHECK_TTL seconds so that
+        connect and disconnect don't each fork a sudo process.
+
         :raises ValueError: If $SUDO_PASSWORD is required but unset
         :return: False if passwordless sudo, True otherwise.
         """
-        try:
-            check_call("sudo -n true".split(), stdout=PIPE, stderr=PIPE)
-        except CalledProcessError:
-            if not os.environ.get("SUDO_PASSWORD"):
-                err_msg = "Environment variable SUDO_PASSWORD must be set"
-                raise ValueError(err_msg) from None
+        now = time.monotonic()
+        if (
+            OpenVPNClient._pw_cache is None
+            or now - OpenVPNClient._pw_checked_at > SUDO_CHECK_TTL
+        ):
+            try:
+                check_call("sudo -n true".split(), stdout=PIPE, stderr=PIPE)
+            except CalledProcessError:
+                OpenVPNClient._pw_cache = True
+            else:
+                OpenVPNClient._pw_cache = False
+            OpenVPNClient._pw_checked_at = now
 
-            return True
-        else:
-            return False
+        if OpenVPNClient._pw_cache and not os.environ.get("SUDO_PASSWORD"):
+            err_msg = "Environment variable SUDO_PASSWORD must be set"
+            raise ValueError(err_msg)
+
+        return OpenVPNClient._pw_cache
 
     @staticmethod
     def _get_pid() -> int:
@@ -225,7 +270,13 @@ class OpenVPNClient:
         :return: The process ID
         """
         try:
-            return int(Path(PID_FILE).read_text(encoding="ascii").strip())
+            # raw read: the file only ever holds a short ascii integer
+            fd = os.open(PID_FILE, os.O_RDONLY)
+            try:
+                buf = os.read(fd, 32)
+            finally:
+                os.close(fd)
+            return int(buf)
         except FileNotFoundError:
             return -1
         except ValueError:
@@ -235,33 +286,9 @@ class OpenVPNClient:
 
     @staticmethod
     def _cleanup() -> None:
-        """Remove the temporary files.
-
-        :raises FileNotFoundError: If a file doesn't exist
-        """
-        err_msg = "File(s) non-existent:"
-        failed = False
-        try:
-            PID_FILE.unlink()
-        except FileNotFoundError:
-            failed = True
-            err_msg += f"\n - {PID_FILE}"
-
-        try:
-            STDERR_FILE.unlink()
-        except FileNotFoundError:
-            failed = True
-            err_msg = f"\n - {STDERR_FILE}"
-
-        try:
-            STDOUT_FILE.unlink()
-        except FileNotFoundError:
-            failed = True
-            err_msg = f"\n - {STDOUT_FILE}"
-
-        if failed:
-            logger.info(err_msg)
-            raise FileNotFoundError(err_msg)
+        """Remove the temporary files, ignoring any that are already gone."""
+        for path in (PID_FILE, STDERR_FILE, STDOUT_FILE):
+            path.unlink(missing_ok=True)
 
     @staticmethod
     def disconnect() -> None:
@@ -291,9 +318,13 @@ class OpenVPNClient:
             process.stdin.write(os.environ["SUDO_PASSWORD"] + "\n")
             process.stdin.flush()
 
+        # a pid from PID_FILE may belong to another interpreter's connection
+        child = OpenVPNClient._child
+        proc = child if child is not None and child.pid == process.pid else None
+
         try:
-            OpenVPNClient._on_process_exit(pid=process.pid, timeout=10)
-        except psutil.TimeoutExpired:
+            OpenVPNClient._on_process_exit(pid=process.pid, proc=proc, timeout=10)
+        except (psutil.TimeoutExpired, subprocess.TimeoutExpired):
             msg = "Failed to terminate OpenVPN process, killing instead"
             logger.info(msg)
 
@@ -303,7 +334,7 @@ class OpenVPNClient:
                 process.stdin.write(os.environ["SUDO_PASSWORD"] + "\n")
                 process.stdin.flush()
 
-            OpenVPNClient._on_process_exit(pid=process.pid, timeout=5)
+            OpenVPNClient._on_process_exit(pid=process.pid, proc=proc, timeout=5)
 
 
 usage = """
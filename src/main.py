@@ -1,9 +1,41 @@
 # fast_app.py
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import ORJSONResponse
+import asyncio
+import gzip
+import httpx
+import orjson
 import socket
 import uvicorn
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Имя и IP хоста не меняются за время жизни процесса, а gethostbyname
+# блокирует event loop, поэтому резолвим один раз при импорте
+HOST_NAME = socket.gethostname()
+HOST_IP = socket.gethostbyname(HOST_NAME)
+
+# Общий HTTP-клиент: пул соединений переиспользуется между запросами
+_HTTP = httpx.AsyncClient(timeout=5)
+
+# Максимум сообщений в одном WebSocket-фрейме
+BATCH_LIMIT = 256
+# Сколько непереваренных сообщений держим на соединение; дальше приём
+# притормаживает, и медленный или злонамеренный клиент упирается в TCP-окно
+QUEUE_LIMIT = 4 * BATCH_LIMIT
+# Сколько ждать после первого сообщения, чтобы набрать пачку
+BATCH_DELAY = 0.001
+
+# Клиент, предложивший этот subprotocol, получает бинарные фреймы в gzip;
+# остальные получают обычный JSON (плюс permessage-deflate, если договорились)
+GZIP_SUBPROTOCOL = "json.gzip"
+
+# Открытые соединения /ws, которым рассылает broadcast(): ws -> нужен ли gzip
+subscribers: dict[WebSocket, bool] = {}
+
+
+def _gzip(payload: bytes) -> bytes:
+    return gzip.compress(payload, compresslevel=1)
 
 
 @app.get("/")
@@ -11,50 +43,105 @@ async def get_ip_addresses(request: Request):
     # Get client IP
     client_ip = request.client.host
 
-    # Get host IP
-    host_name = socket.gethostname()
-    host_ip = socket.gethostbyname(host_name)
-
     return {
         "client_ip": client_ip,
-        "host_ip": host_ip,
-        "host_name": host_name
+        "host_ip": HOST_IP,
+        "host_name": HOST_NAME
     }
 
 
 @app.get("/ip")
-def get_ip():
-    import requests
-    return {"ip": requests.get("https://api.ipify.org").text}
+async def get_ip():
+    r = await _HTTP.get("https://api.ipify.org")
+    return {"ip": r.text}
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await _HTTP.aclose()
+
+
+async def _receive_messages(websocket: WebSocket, queue: asyncio.Queue):
+    # Только вычитываем сокет, вся обработка в _send_batches, чтобы
+    # медленный ответ не задерживал приём
+    while True:
+        await queue.put(await websocket.receive_text())
+
+
+async def _send_batches(websocket: WebSocket, queue: asyncio.Queue, compressed: bool):
+    # Один dict на соединение: префикс "echo" пишется ключом раз на фрейм,
+    # а не форматируется в каждое сообщение
+    frame = {"echo": None}
+    while True:
+        # Ждём первое сообщение, даём остальным BATCH_DELAY догнать его,
+        # затем забираем всё, что накопилось
+        batch = [await queue.get()]
+        await asyncio.sleep(BATCH_DELAY)
+        while not queue.empty() and len(batch) < BATCH_LIMIT:
+            batch.append(queue.get_nowait())
+        frame["echo"] = batch
+        payload = orjson.dumps(frame)
+        await websocket.send_bytes(_gzip(payload) if compressed else payload)
+
+
+async def broadcast(payload: bytes):
+    # payload сериализуется один раз (orjson.dumps) на стороне вызывающего,
+    # сжимается тоже не больше одного раза, и всем подписчикам уходят
+    # одни и те же байты
+    gzipped = None
+    for ws, compressed in list(subscribers.items()):
+        if compressed and gzipped is None:
+            gzipped = _gzip(payload)
+        try:
+            await ws.send_bytes(gzipped if compressed else payload)
+        # uvicorn сообщает о закрытом пире через ClientDisconnected (OSError),
+        # starlette - RuntimeError при отправке после close
+        except (OSError, RuntimeError):
+            subscribers.pop(ws, None)
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    compressed = GZIP_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=GZIP_SUBPROTOCOL if compressed else None)
 
     try:
         # Получаем IP клиента
         client_host, client_port = websocket.client
 
-        # Получаем IP и имя сервера
-        host_name = socket.gethostname()
-        host_ip = socket.gethostbyname(host_name)
-
-        await websocket.send_json({
+        greeting = orjson.dumps({
             "status": "connected",
             "client_ip": client_host,
-            "host_ip": host_ip,
-            "host_name": host_name
+            "host_ip": HOST_IP,
+            "host_name": HOST_NAME
         })
-
-        while True:
-            # Echo, чтобы WebSocket не закрылся
-            msg = await websocket.receive_text()
-            await websocket.send_text(f"echo: {msg}")
-
-    except WebSocketDisconnect:
+        await websocket.send_bytes(_gzip(greeting) if compressed else greeting)
+        # Рассылки начинаем получать только после приветствия
+        subscribers[websocket] = compressed
+
+        # Echo, чтобы WebSocket не закрылся: ответы уходят пачками,
+        # один JSON-массив на фрейм вместо фрейма на каждое сообщение
+        queue = asyncio.Queue(maxsize=QUEUE_LIMIT)
+        receiver = asyncio.create_task(_receive_messages(websocket, queue))
+        sender = asyncio.create_task(_send_batches(websocket, queue, compressed))
+        tasks = {receiver, sender}
+        try:
+            # Обе задачи бесконечные: первая упавшая завершает обработчик,
+            # иначе receiver без sender'а навсегда встанет на полной очереди
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ClientDisconnected (OSError) - sender наткнулся на закрытый сокет
+    except (WebSocketDisconnect, OSError):
         print("Client disconnected")
 
+    finally:
+        subscribers.pop(websocket, None)
+
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, ws_per_message_deflate=True)